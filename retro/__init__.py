@@ -5,17 +5,20 @@ from prompt_toolkit.shortcuts import input_dialog
 from retro.app import start_app
 from retro.backend import Backend
 from retro.net.client import RPCStoreClient
+from retro.relay import Relay
 
 
-def start_server(blocking=False) -> Optional[str]:
+def start_server(blocking=False, use_tunnel=True) -> Optional[str]:
     """
     Start the backend
 
     :param blocking: Starts Backend and blocks. This is for server-only mode.
+    :param use_tunnel: Expose the backend via ngrok, otherwise it is only reachable on this machine
     :return: Connection string if blocking==False
     """
     backend = Backend(
-        auth_token=None  # this will be taken from the global ngrok config
+        auth_token=None,  # this will be taken from the global ngrok config
+        use_tunnel=use_tunnel,
     )
     if blocking:
         backend.run()
@@ -23,17 +26,39 @@ def start_server(blocking=False) -> Optional[str]:
     else:
         backend.prepare_tunnel()  # prepare tunnel, so we can return connection_string without raise condition
         backend.start()
+        backend.ready.wait(timeout=5)
         return backend.connection_string()
 
 
+def start_relay(connection_string: str, port: Optional[int] = None, use_tunnel=True):
+    """
+    Start a relay for the given backend and block
+
+    :param connection_string: Relay connection string of the upstream backend
+    :param port: Local port of the relay, required to run multiple relays on one machine
+    :param use_tunnel: Expose the relay via ngrok, otherwise it is only reachable on this machine
+    """
+    relay = Relay(
+        connection_string,
+        auth_token=None,  # this will be taken from the global ngrok config
+        port=port,
+        use_tunnel=use_tunnel,
+    )
+    relay.run()
+
+
 def start(args):
-    if args.server_only:
+    if args.relay:
+        # Relay mode
+        start_relay(args.relay, port=args.port, use_tunnel=not args.no_tunnel)
+        return
+    elif args.server_only:
         # Only Server mode
-        start_server(blocking=True)
+        start_server(blocking=True, use_tunnel=not args.no_tunnel)
         return
     elif args.server:
         # Server and App mode
-        connection_string = start_server(False)
+        connection_string = start_server(False, use_tunnel=not args.no_tunnel)
     else:
         # App mode
         connection_string = input_dialog(title="Connect to retro", text="Key:").run()
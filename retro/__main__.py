@@ -12,10 +12,22 @@ def main():
     parser.add_argument(
         "-so", "--server-only", action="store_true", help="only starts server"
     )
+    parser.add_argument(
+        "-r",
+        "--relay",
+        metavar="CONNECTION_STRING",
+        help="only starts a relay for the given retro",
+    )
+    parser.add_argument("-p", "--port", type=int, help="local port of the relay")
+    parser.add_argument(
+        "--no-tunnel",
+        action="store_true",
+        help="serve on localhost without ngrok, e.g. to test relays on one machine",
+    )
     parser.add_argument("-d", "--debug", action="store_true", help="provide debug logs")
     args = parser.parse_args()
 
-    if args.server_only:
+    if args.server_only or args.relay:
         logging.basicConfig(encoding="utf-8", level=logging.DEBUG)
     elif args.debug:
         logging.basicConfig(
@@ -12,6 +12,7 @@ from prompt_toolkit.layout.containers import VSplit, Window
 from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
 from prompt_toolkit.layout.layout import Layout
 
+from retro.net.client import RPCStoreClient
 from retro.persistence import Category, RetroStore, InMemoryStore
 
 logger = logging.getLogger(__name__)
@@ -51,6 +52,7 @@ def start_app(store: RetroStore, connection_string: str = ""):
     @kb.add("c-m")
     def enter_(event):
         text = input_buffer.text
+        status_buffer.text = ""
 
         if text.startswith("+"):
             input_buffer.reset()
@@ -87,13 +89,23 @@ def start_app(store: RetroStore, connection_string: str = ""):
 
     @kb.add("c-p")
     def ping_(event):
-        start = time()
-        store.list(Category.GOOD)
-        app.print_text(f"latency: {time() - start:.3f}")
+        if isinstance(store, RPCStoreClient):
+            try:
+                latency = store.ping()
+            except Exception as e:
+                logger.exception(f"Ping failed")
+                status_buffer.text = f"Ping failed: {str(e) or e.__class__.__name__}"
+                return
+        else:
+            start = time()
+            store.list(Category.GOOD)
+            latency = time() - start
+        app.print_text(f"latency: {latency:.3f}")
 
     good_buffer = FormattedTextControl()
     neutral_buffer = FormattedTextControl()
     bad_buffer = FormattedTextControl()
+    status_buffer = FormattedTextControl()
 
     input_buffer = Buffer()
     input = Window(content=BufferControl(buffer=input_buffer), height=1)
@@ -147,6 +159,7 @@ def start_app(store: RetroStore, connection_string: str = ""):
                 height=1,
                 align=WindowAlign.CENTER,
             ),
+            Window(content=status_buffer, height=1, style="fg:ansired"),
             input,
         ],
         style="bg:grey",
@@ -157,6 +170,31 @@ def start_app(store: RetroStore, connection_string: str = ""):
 
     app = Application(layout=layout, key_bindings=kb, full_screen=True)
 
+    def call_in_app(func):
+        # client callbacks run in a background thread
+        if app.loop:
+            app.loop.call_soon_threadsafe(func)
+
+    def changed():
+        refresh()
+        app.invalidate()
+
+    def show_status(text):
+        def show():
+            status_buffer.text = text
+            app.invalidate()
+
+        call_in_app(show)
+
+    if isinstance(store, RPCStoreClient):
+        store.on_change = lambda: call_in_app(changed)
+        store.on_reject = lambda method, params, message: show_status(
+            f"Rejected {method} {params}: {message}"
+        )
+        store.on_disconnect = lambda message: show_status(
+            f"Lost connection to the server: {message}"
+        )
+
     async def active_refresh():
         counter = 0
         while counter < 5:
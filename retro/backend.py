@@ -1,14 +1,25 @@
 import base64
+import hmac
+import inspect
 import logging
+import secrets
 import socket
-from threading import Thread
-from typing import cast, Optional, Dict
+from contextlib import nullcontext
+from threading import Thread, Lock, Event
+from time import monotonic
+from typing import cast, Optional, Dict, List
 
 from pyngrok import ngrok
 from pyngrok.conf import PyngrokConfig
 from pyngrok.ngrok import NgrokTunnel
 
-from retro.net.network import Network, SecureNetwork
+from retro.net.network import (
+    Network,
+    SecureNetwork,
+    FrameTooLargeError,
+    RPCError,
+    RATE_LIMIT_EXCEEDED,
+)
 from retro.persistence import InMemoryStore, RetroStore, FileStore
 
 logger = logging.getLogger(__name__)
@@ -17,19 +28,54 @@ logger = logging.getLogger(__name__)
 class Backend(Thread):
     port = 8081
 
-    def __init__(self, auth_token: Optional[str]):
+    def __init__(
+        self,
+        auth_token: Optional[str],
+        *,
+        port: Optional[int] = None,
+        use_tunnel: bool = True,
+        max_connections: int = 64,
+        idle_timeout: Optional[float] = 60.0,
+        max_requests_per_second: Optional[float] = 20.0,
+        max_relay_requests_per_second: Optional[float] = 500.0,
+        max_frame_size: Optional[int] = 16 * 1024,
+    ):
+        """
+        :param auth_token: ngrok auth token, None to use the global ngrok config
+        :param port: Local port to listen on, defaults to `Backend.port`, 0 picks a free one
+        :param use_tunnel: Expose the port via ngrok, otherwise clients connect via loopback
+        :param max_connections: Connections accepted at the same time, further ones are closed
+        :param idle_timeout: Seconds a client may stay silent before it is disconnected
+        :param max_requests_per_second: Requests per connection and second, None for no limit
+        :param max_relay_requests_per_second: Same for connections, which registered as relay,
+            which requires the secret of `relay_connection_string`
+        :param max_frame_size: Largest request frame in bytes, bigger ones close the connection
+        """
         super().__init__(daemon=True)
         self._auth_token = auth_token
         self.__key = SecureNetwork.generate_key()
+        self.__relay_secret = secrets.token_urlsafe()
+
+        if port is not None:
+            self.port = port
+        self.use_tunnel = use_tunnel
+        self.ready = Event()
+
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.max_requests_per_second = max_requests_per_second
+        self.max_relay_requests_per_second = max_relay_requests_per_second
+        self.max_frame_size = max_frame_size
 
         self._tunnel: Optional[NgrokTunnel] = None
+        self._handlers: List[RPCConnectionHandler] = []
 
     def run(self) -> None:
         self.prepare_tunnel()
         self.serve()
 
     def prepare_tunnel(self):
-        if self._tunnel is None:
+        if self.use_tunnel and self._tunnel is None:
             self._tunnel = cast(
                 NgrokTunnel,
                 ngrok.connect(
@@ -39,67 +85,199 @@ class Backend(Thread):
                 ),
             )
 
-    def serve(self):
-        store = RPCStore(FileStore("./retro.json"))
+    def create_store(self) -> RetroStore:
+        return FileStore("./retro.json")
 
-        logger.info(f"Connection string: {self.connection_string()}")
+    def serve(self):
+        store = RPCStore(self.create_store())
 
-        threads = []
         # Listen for new connections
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             logger.debug(f"Start server on 127.0.0.1:{self.port}")
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind(("127.0.0.1", self.port))
             s.listen()
+            # port 0 lets the OS pick a free port
+            self.port = s.getsockname()[1]
+            self.ready.set()
+
+            logger.info(f"Connection string: {self.connection_string()}")
+            logger.info(f"Relay connection string: {self.relay_connection_string()}")
 
             while True:
                 conn, addr = s.accept()
 
+                # forget handlers of closed connections
+                self._handlers = [h for h in self._handlers if h.is_alive()]
+                if len(self._handlers) >= self.max_connections:
+                    logger.warning(
+                        f"Reject connection, limit of {self.max_connections} reached"
+                    )
+                    conn.close()
+                    continue
+
                 logger.debug(f"Handle new connection")
+                conn.settimeout(self.idle_timeout)
                 handler = RPCConnectionHandler(
-                    network=SecureNetwork(conn, self.__key), rpc_handler=store
+                    network=SecureNetwork(
+                        conn, self.__key, max_frame_size=self.max_frame_size
+                    ),
+                    rpc_handler=store,
+                    rate_limiter=RateLimiter.create(self.max_requests_per_second),
+                    relay_rate_limiter=RateLimiter.create(
+                        self.max_relay_requests_per_second
+                    ),
+                    relay_secret=self.__relay_secret,
                 )
                 handler.start()
-                threads.append(handler)
+                self._handlers.append(handler)
 
     def url(self):
+        if not self.use_tunnel:
+            return f"tcp://127.0.0.1:{self.port}"
         return self._tunnel.public_url
 
     def connection_string(self):
         string = f"{self.url()}|{self.__key}"
         return base64.urlsafe_b64encode(string.encode()).decode()
 
+    def relay_connection_string(self):
+        """Connection string for relays, only share it with hosts of relays"""
+        string = f"{self.url()}|{self.__key}|{self.__relay_secret}"
+        return base64.urlsafe_b64encode(string.encode()).decode()
+
 
 class RPCHandler:
     def rpc(self, data: Dict) -> Dict:
         raise NotImplementedError()
 
 
+class RateLimiter:
+    """Token bucket, allows `rate` requests per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        # a bucket smaller than one token would never allow a request
+        self.burst = max(1.0, burst or rate)
+        self._tokens = self.burst
+        self._last = monotonic()
+
+    @classmethod
+    def create(cls, rate: Optional[float]) -> Optional["RateLimiter"]:
+        """RateLimiter for the given rate, None for no limit"""
+        return cls(rate) if rate is not None else None
+
+    def allow(self) -> bool:
+        now = monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+
 class RPCConnectionHandler(Thread):
-    def __init__(self, network: Network, rpc_handler: RPCHandler):
+    REGISTER_RELAY = "register_relay"
+
+    def __init__(
+        self,
+        network: Network,
+        rpc_handler: RPCHandler,
+        rate_limiter: Optional[RateLimiter] = None,
+        relay_rate_limiter: Optional[RateLimiter] = None,
+        relay_secret: Optional[str] = None,
+    ):
+        """
+        :param rate_limiter: Limits requests of the connection, None for no limit
+        :param relay_rate_limiter: Replaces `rate_limiter`, once the connection registered as relay
+        :param relay_secret: Secret a relay has to register with, None to not accept relays
+        """
         super().__init__(daemon=True)
         self.network = network
         self.rpc_handler = rpc_handler
+        self.rate_limiter = rate_limiter
+        self.relay_rate_limiter = relay_rate_limiter
+        self.relay_secret = relay_secret
+
+    def handle(self, data) -> Dict:
+        if self.rate_limiter and not self.rate_limiter.allow():
+            return {
+                "error": {"code": RATE_LIMIT_EXCEEDED, "message": "Rate limit exceeded"}
+            }
+
+        if isinstance(data, dict) and data.get("method") == self.REGISTER_RELAY:
+            return self.register_relay(data.get("params") or {})
+
+        return self.rpc_handler.rpc(data)
+
+    def register_relay(self, params) -> Dict:
+        secret = params.get("secret") if isinstance(params, dict) else None
+        if (
+            self.relay_secret is None
+            or not isinstance(secret, str)
+            or not hmac.compare_digest(secret.encode(), self.relay_secret.encode())
+        ):
+            logger.warning(f"Reject relay registration with invalid secret")
+            return {"error": {"code": -32602, "message": "Invalid relay secret"}}
+
+        # a relay forwards the requests of all its clients over this connection
+        logger.info(f"Connection registered as relay")
+        self.rate_limiter = self.relay_rate_limiter
+        return {"result": None}
 
     def run(self):
         with self.network:
-            while data := self.network.recv_json():
-                response = self.rpc_handler.rpc(data)
-                self.network.send_json(response)
+            try:
+                while data := self.network.recv_json():
+                    self.network.send_json(self.handle(data))
+            except socket.timeout:
+                logger.debug(f"Close idle connection")
+            except FrameTooLargeError as e:
+                logger.warning(f"Close connection: {e}")
+            except OSError:
+                logger.debug(f"Close broken connection", exc_info=True)
+            except Exception:
+                logger.exception(f"Close connection after unexpected error")
 
 
 class RPCStore(RPCHandler):
     def __init__(self, store: RetroStore = None):
         self.store = store or InMemoryStore()
+        # calls of stores, which are not thread safe, are handled one after the other
+        self._lock = nullcontext() if self.store.thread_safe else Lock()
 
     def rpc(self, data: Dict):
+        if not isinstance(data, dict):
+            return {"error": {"code": -32600, "message": "Invalid Request"}}
+
         method_name = data.get("method")
-        params = data.get("params", {})
+        params = data.get("params") or {}
 
-        if not hasattr(self.store, method_name):
+        # only expose the store interface, not helpers of the implementation
+        if (
+            not isinstance(method_name, str)
+            or method_name not in RetroStore.__abstractmethods__
+        ):
             return {"error": {"code": -32601, "message": "Method not found"}}
 
         method = getattr(self.store, method_name)
-        result = method(**params)
+        try:
+            inspect.signature(method).bind(**params)
+        except TypeError:
+            return {"error": {"code": -32602, "message": "Invalid params"}}
+
+        try:
+            with self._lock:
+                result = method(**params)
+        except RPCError as e:
+            # e.g. a relay passes on errors of its upstream
+            return {"error": {"code": e.code, "message": e.message}}
+        except Exception:
+            logger.exception(f"RPC_ERROR {method_name}({params})")
+            return {"error": {"code": -32603, "message": "Internal error"}}
 
         return {"result": result}
 
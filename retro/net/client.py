@@ -1,12 +1,16 @@
 import base64
 import logging
 import socket
-from threading import Lock
-from typing import Optional, List
+from collections import deque
+from dataclasses import dataclass, replace
+from itertools import count
+from threading import Lock, Condition, Thread
+from time import time, monotonic, sleep
+from typing import Optional, List, Dict, Deque, Callable
 from urllib.parse import urlparse
 from uuid import uuid4
 
-from retro.net.network import SecureNetwork, Network
+from retro.net.network import SecureNetwork, Network, RATE_LIMIT_EXCEEDED
 from retro.persistence import Category, RetroStore, Item
 
 logger = logging.getLogger(__name__)
@@ -17,66 +21,296 @@ class Client:
 
     def __init__(self, *, net: Network = None):
         self.net = net
+        # only part of the relay connection string of a backend
+        self.relay_secret: Optional[str] = None
 
-    def connect(self, connection_string: str):
+    def connect(self, connection_string: str, timeout: Optional[float] = None):
+        """
+        :param timeout: Seconds to wait for the server, None to wait forever
+        """
         raw = base64.urlsafe_b64decode(connection_string.encode()).decode()
-        url_str, key = raw.split("|")
+        url_str, key, *relay_secret = raw.split("|")
         url = urlparse(url_str)
+        self.relay_secret = relay_secret[0] if relay_secret else None
 
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(timeout)
         s.connect((url.hostname, url.port))
 
         self.net = SecureNetwork(s, key=key)
 
 
-class RPCStoreClient(Client, RetroStore):
+class RPCClient(Client):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._lock = Lock()
 
-    def _rpc_call(self, method: str, **params):
-        # TODO move RPC client into its own class
+    def call(self, method: str, **params) -> Dict:
+        """Returns the raw response, raises ConnectionError if the server does not answer"""
         with self._lock:
             request_id = str(uuid4())
+            request = {
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params,
+                "id": request_id,
+            }
+            logger.debug(f"-> {request_id}: {request}")
             try:
-                request = {
-                    "jsonrpc": "2.0",
-                    "method": method,
-                    "params": params,
-                    "id": request_id,
-                }
-                logger.debug(f"-> {request_id}: {request}")
                 self.net.send_json(request)
                 response = self.net.recv_json()
-                logger.debug(f"<- {request_id}: {response}")
+            except socket.timeout:
+                # a late response would be taken as answer to the next request
+                self.net.close()
+                raise ConnectionError(f"No response for {request_id} in time")
+            logger.debug(f"<- {request_id}: {response}")
+
+        if response is None:
+            raise ConnectionError(f"No response for {request_id}")
+        return response
+
+
+@dataclass
+class PendingWrite:
+    method: str
+    params: Dict
+    key: Optional[int] = None  # key of an added item, negative until the server assigned one
+
+
+class RPCStoreClient(RPCClient, RetroStore):
+    """
+    Store client, which keeps a local copy of the board.
+
+    Writes are applied to the local copy right away and sent to the server by a background thread.
+    The copy is reconciled with the server once all writes are sent, but at least every `poll_interval` seconds.
+    Rejected writes are rolled back and reported to `on_reject`.
+    """
+
+    # first delay before a write is sent again, which the server was too busy to handle
+    retry_delay = 0.1
+
+    def __init__(
+        self,
+        *,
+        poll_interval: float = 2.0,
+        on_change: Optional[Callable[[], None]] = None,
+        on_reject: Optional[Callable[[str, Dict, str], None]] = None,
+        on_disconnect: Optional[Callable[[str], None]] = None,
+        **kwargs,
+    ):
+        """
+        :param poll_interval: Seconds between syncs with the server
+        :param on_change: Called, when the local copy changed by a sync with the server
+        :param on_reject: Called with method, params and error message, when a write was rejected
+        :param on_disconnect: Called with the error message, when the connection to the server is lost
+        """
+        super().__init__(**kwargs)
+
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.on_reject = on_reject
+        self.on_disconnect = on_disconnect
+        self.connection_error: Optional[Exception] = None
+
+        self._changes = Condition()
+        # board of the server, including acknowledged writes
+        self._server_items: Dict[int, Item] = {}
+        # board of the server with pending writes applied
+        self._items: Dict[int, Item] = {}
+        self._pending: Deque[PendingWrite] = deque()
+        self._temp_keys = count(-1, -1)
+        self._assigned_keys: Dict[int, int] = {}
+        self._last_sync = 0.0
+
+    def connect(self, connection_string: str):
+        super().connect(connection_string)
+        self.start()
+
+    def start(self):
+        """Fetch the board and start sending writes in the background"""
+        self.sync()
+        Thread(target=self._write_behind, daemon=True).start()
+
+    def ping(self) -> float:
+        """Latency of a round trip to the server in seconds, raises if the server does not answer"""
+        start = time()
+        self.call("list", category=Category.GOOD)
+        return time() - start
+
+    # --- sync with server
+    def sync(self):
+        """Replaces the local copy with the board of the server, pending writes are applied on top"""
+        self._last_sync = monotonic()
+        response = self.call("list")
+        if "error" in response:
+            logger.warning(f"Sync failed: {response['error'].get('message')}")
+            return
+        items = {item["key"]: Item(**item) for item in response.get("result") or []}
+
+        with self._changes:
+            self._server_items = items
+            changed = self._rebuild()
+
+        if changed and self.on_change:
+            self.on_change()
+
+    def _write_behind(self):
+        delay = self.retry_delay
+        while True:
+            with self._changes:
+                self._changes.wait_for(lambda: self._pending, timeout=self.poll_interval)
+                write = self._pending[0] if self._pending else None
 
-            except BrokenPipeError:
-                logger.exception(f"Lost connection, I guess, this is the end.")
-                raise
+            try:
+                if write and not self._send(write):
+                    # server is busy, send the write again after a while
+                    sleep(delay)
+                    delay = min(delay * 2, self.poll_interval)
+                elif write:
+                    delay = self.retry_delay
+
+                with self._changes:
+                    drained = not self._pending
+                # also sync while writes keep coming, so the copy does not go stale
+                if drained or monotonic() - self._last_sync >= self.poll_interval:
+                    self.sync()
+            except ConnectionError as e:
+                self._disconnect(e)
+                return
             except Exception:
-                logger.debug(f"xx {request_id}:failed!")
-                logger.exception(f"RPC_ERROR {method}({params})")
-                return None
-        return response.get("result")
+                logger.exception(f"Sync failed, retry in {delay}s")
+                sleep(delay)
+                delay = min(delay * 2, self.poll_interval)
 
-    def list(self, category: Optional[str] = None) -> List[Item]:
-        response = self._rpc_call("list", category=category)
-        if not response:
-            return []
+    def _send(self, write: PendingWrite) -> bool:
+        """Sends the oldest pending write, returns False if the server was too busy to handle it"""
+        response = self.call(write.method, **write.params)
+        error = response.get("error")
+        if error and error.get("code") == RATE_LIMIT_EXCEEDED:
+            return False
+
+        rejected = []
+        with self._changes:
+            self._pending.popleft()
+
+            if error:
+                rejected.append((write, error.get("message")))
+            elif write.method == "add_item" and isinstance(response.get("result"), int):
+                self._assign_key(write, response["result"])
+            if write.method == "add_item" and write.key < 0:
+                # the item has no key on the server, writes which refer to it can not be sent
+                rejected += [(w, "Item was not added") for w in self._drop_writes(write.key)]
+
+            if not error:
+                self._apply(self._server_items, write)
+            changed = self._rebuild()
+
+        for rejected_write, message in rejected:
+            self._rejected(rejected_write, message)
+        if changed and self.on_change:
+            self.on_change()
+        return True
+
+    def _rejected(self, write: PendingWrite, message: str):
+        logger.warning(f"Rejected {write.method}({write.params}): {message}")
+        if self.on_reject:
+            self.on_reject(write.method, write.params, message)
+
+    def _disconnect(self, error: Exception):
+        logger.error(f"Lost connection, stop sending writes: {error}")
+        with self._changes:
+            self.connection_error = error
+            dropped = list(self._pending)
+            self._pending.clear()
+            changed = self._rebuild()
+
+        for write in dropped:
+            self._rejected(write, "Lost connection")
+        if changed and self.on_change:
+            self.on_change()
+        if self.on_disconnect:
+            self.on_disconnect(str(error) or error.__class__.__name__)
 
-        return [Item(**item) for item in response]
+    # --- local copy
+    def _write(self, method: str, params: Dict, key: Optional[int] = None):
+        write = PendingWrite(method, params, key)
+        with self._changes:
+            if "key" in params:
+                # the item might have got its key from the server in the meantime
+                params["key"] = self._assigned_keys.get(params["key"], params["key"])
+
+            if self.connection_error:
+                error = "Lost connection"
+            elif "key" in params and params["key"] not in self._items:
+                error = f"Item {params['key']} not found"
+            else:
+                error = None
+                self._apply(self._items, write)
+                self._pending.append(write)
+                self._changes.notify()
+
+        if error:
+            self._rejected(write, error)
+
+    def _assign_key(self, write: PendingWrite, key: int):
+        self._assigned_keys[write.key] = key
+        for pending in self._pending:
+            if pending.params.get("key") == write.key:
+                pending.params["key"] = key
+        write.key = key
+
+    def _drop_writes(self, key: int) -> List[PendingWrite]:
+        dropped = [w for w in self._pending if w.params.get("key") == key]
+        self._pending = deque(w for w in self._pending if w.params.get("key") != key)
+        return dropped
+
+    def _rebuild(self) -> bool:
+        """Applies pending writes to a copy of the server items, returns True if the local copy changed"""
+        old_items = self._items
+        self._items = {key: replace(item) for key, item in self._server_items.items()}
+        for write in self._pending:
+            self._apply(self._items, write)
+        return old_items != self._items
+
+    @staticmethod
+    def _apply(items: Dict[int, Item], write: PendingWrite):
+        if write.method == "add_item":
+            items[write.key] = Item(write.key, **write.params)
+            return
+
+        item = items.get(write.params["key"])
+        if item is None:
+            return
+        elif write.method == "move_item":
+            item.category = write.params["category"]
+        elif write.method == "remove":
+            del items[item.key]
+        elif write.method == "toggle":
+            item.done = not item.done
+
+    def list(self, category: Optional[str] = None) -> List[Item]:
+        with self._changes:
+            # items which are not confirmed by the server yet go last
+            items = sorted(self._items.values(), key=lambda i: (i.key < 0, abs(i.key)))
+            return [
+                replace(item)
+                for item in items
+                if not category or item.category == category
+            ]
 
-    def add_item(self, text: str, category: str) -> None:
-        return self._rpc_call("add_item", text=text, category=category)
+    def add_item(self, text: str, category: str) -> Optional[int]:
+        self._write(
+            "add_item", dict(text=text, category=category), next(self._temp_keys)
+        )
 
     def move_item(self, key: int, category: str) -> None:
-        return self._rpc_call("move_item", key=key, category=category)
+        self._write("move_item", dict(key=key, category=category))
 
     def remove(self, key: int) -> None:
-        return self._rpc_call("remove", key=key)
+        self._write("remove", dict(key=key))
 
     def toggle(self, key: int) -> None:
-        return self._rpc_call("toggle", key=key)
+        self._write("toggle", dict(key=key))
 
 
 if __name__ == "__main__":
@@ -16,27 +16,63 @@ class EnhancedJSONEncoder(JSONEncoder):
         return super().default(o)
 
 
+class FrameTooLargeError(ValueError):
+    pass
+
+
+# JSON-RPC server error, the request may be sent again later
+RATE_LIMIT_EXCEEDED = -32000
+
+
+class RPCError(Exception):
+    """Error response of a remote procedure call"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
 class Network:
     BUFFER = 2
     ORDER = "big"
 
-    def __init__(self, socket: socket.socket):
+    def __init__(self, socket: socket.socket, max_frame_size: Optional[int] = None):
         self.socket = socket
+        self.max_frame_size = max_frame_size
         self._lock = Lock()
 
+    def _recv_exactly(self, size: int) -> bytes:
+        """Reads exactly `size` bytes, returns b"" if the peer closed the connection"""
+        data = b""
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                return b""
+            data += chunk
+        return data
+
     def _recv(self) -> str:
         with self._lock:
-            raw_length = self.socket.recv(self.BUFFER)
+            raw_length = self._recv_exactly(self.BUFFER)
+            if not raw_length:
+                return ""
+
             length = int.from_bytes(raw_length, self.ORDER, signed=False)
-            data = self.socket.recv(length)
+            if self.max_frame_size is not None and length > self.max_frame_size:
+                raise FrameTooLargeError(
+                    f"Frame of {length} bytes exceeds limit of {self.max_frame_size}"
+                )
+
+            data = self._recv_exactly(length)
             return data.decode()
 
     def _send(self, msg: str):
         with self._lock:
             data = msg.encode()
             length = int.to_bytes(len(data), self.BUFFER, self.ORDER, signed=False)
-            self.socket.sendall(length)
-            self.socket.sendall(data)
+            # single write, so Nagle does not hold back the payload behind the length
+            self.socket.sendall(length + data)
 
     def recv_json(self) -> Optional[dict]:
         data = self._recv()
@@ -63,8 +99,10 @@ class Network:
 
 
 class SecureNetwork(Network):
-    def __init__(self, socket_: socket.socket, key: str):
-        super().__init__(socket_)
+    def __init__(
+        self, socket_: socket.socket, key: str, max_frame_size: Optional[int] = None
+    ):
+        super().__init__(socket_, max_frame_size=max_frame_size)
 
         from cryptography.fernet import Fernet
 
@@ -39,12 +39,16 @@ class Item:
 
 
 class RetroStore(ABC):
+    # True for stores, which guard their state against concurrent calls themselves
+    thread_safe = False
+
     @abstractmethod
     def list(self, category: Optional[str] = None) -> List[Item]:
         pass
 
     @abstractmethod
-    def add_item(self, text: str, category: str) -> None:
+    def add_item(self, text: str, category: str) -> Optional[int]:
+        """Returns the key of the new item, if it is known already"""
         pass
 
     @abstractmethod
@@ -70,9 +74,10 @@ class InMemoryStore(RetroStore):
     def _next_id(self) -> int:
         return next(self.__key_generator)
 
-    def add_item(self, text: str, category: str) -> None:
+    def add_item(self, text: str, category: str) -> int:
         next_id = self._next_id()
         self._items[next_id] = Item(next_id, text, category)
+        return next_id
 
     def move_item(self, key: int, category: str) -> None:
         if key in self._items:
@@ -115,11 +120,12 @@ class FileStore(RetroStore):
     def _next_id(self) -> int:
         return next(self.__key_generator)
 
-    def add_item(self, text: str, category: str) -> None:
+    def add_item(self, text: str, category: str) -> int:
         next_id = self._next_id()
         self._items[next_id] = Item(next_id, text, category)
 
         self._save()
+        return next_id
 
     def move_item(self, key: int, category: str) -> None:
         if key in self._items:
@@ -0,0 +1,212 @@
+import logging
+from dataclasses import replace
+from threading import Lock, Thread
+from time import sleep
+from typing import Callable, Dict, List, Optional
+
+from retro.backend import Backend, RPCConnectionHandler
+from retro.net.client import RPCClient
+from retro.net.network import RPCError
+from retro.persistence import RetroStore, Item
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaStore(RetroStore):
+    """
+    Local copy of an upstream store.
+
+    Reads are answered from the copy, which is refreshed every `interval` seconds.
+    Writes are forwarded to the upstream store and applied to the copy, once the upstream store acknowledged them,
+    errors of the upstream store are raised as `RPCError`, so clients of the relay see them.
+    If the connection to the upstream store is lost, reads and writes fail until the sync reconnected.
+    """
+
+    # reads never wait for the upstream store, the copy is replaced as a whole
+    thread_safe = True
+
+    def __init__(
+        self,
+        connect: Callable[[], RPCClient],
+        interval: float = 2.0,
+        max_retry_delay: float = 30.0,
+    ):
+        """
+        :param connect: Returns a new connection to the upstream store
+        :param interval: Seconds between syncs with the upstream store
+        :param max_retry_delay: Longest delay between attempts to reconnect
+        """
+        self.connect = connect
+        self.interval = interval
+        self.max_retry_delay = max_retry_delay
+
+        self.upstream: Optional[RPCClient] = None
+        # requests to the upstream store are sent one after the other,
+        # so the copy is updated in the order the upstream store handled them
+        self._upstream_lock = Lock()
+        self._items: Dict[int, Item] = {}
+
+    def start(self):
+        self.sync()
+        Thread(target=self._poll, daemon=True).start()
+
+    def _poll(self):
+        delay = self.interval
+        while True:
+            sleep(delay)
+            try:
+                self.sync()
+                delay = self.interval
+            except Exception as e:
+                delay = min(delay * 2, self.max_retry_delay)
+                logger.warning(f"Sync with upstream failed, retry in {delay}s: {e}")
+
+    def sync(self):
+        """Replaces the copy with the upstream store, reconnects if the connection was lost"""
+        with self._upstream_lock:
+            if self.upstream is None:
+                self.upstream = self.connect()
+                logger.info(f"Connected to upstream")
+
+            try:
+                result = self._call("list")
+            except RPCError as e:
+                logger.warning(f"Sync failed: {e.message}")
+                return
+
+            self._items = {item["key"]: Item(**item) for item in result or []}
+
+    def _call(self, method: str, **params):
+        """Calls the upstream store, the caller holds the upstream lock"""
+        if self.upstream is None:
+            raise ConnectionError("Lost connection to upstream")
+
+        try:
+            response = self.upstream.call(method, **params)
+        except OSError:
+            # the sync reconnects
+            self.upstream.net.close()
+            self.upstream = None
+            raise
+
+        if "error" in response:
+            error = response["error"]
+            raise RPCError(error.get("code"), error.get("message"))
+        return response.get("result")
+
+    def _forward(self, method: str, **params):
+        with self._upstream_lock:
+            try:
+                result = self._call(method, **params)
+            except OSError:
+                logger.warning(f"Forward {method}({params}) failed", exc_info=True)
+                raise RPCError(-32603, "Lost connection to upstream")
+
+            self._items = self._apply(self._items, method, params, result)
+            return result
+
+    @staticmethod
+    def _apply(
+        items: Dict[int, Item], method: str, params: Dict, result
+    ) -> Dict[int, Item]:
+        """Returns a copy of the items with the acknowledged write applied"""
+        items = dict(items)
+        if method == "add_item":
+            # without the key of the new item, the next sync adds it
+            if isinstance(result, int):
+                items[result] = Item(result, **params)
+            return items
+
+        item = items.get(params["key"])
+        if item is None:
+            pass
+        elif method == "move_item":
+            items[item.key] = replace(item, category=params["category"])
+        elif method == "remove":
+            del items[item.key]
+        elif method == "toggle":
+            items[item.key] = replace(item, done=not item.done)
+        return items
+
+    # read access
+    def list(self, category: Optional[str] = None) -> List[Item]:
+        if self.upstream is None:
+            # do not serve a copy, which is not synced anymore
+            raise RPCError(-32603, "Lost connection to upstream")
+
+        items = sorted(self._items.values(), key=lambda i: i.key)
+        if category:
+            return [item for item in items if item.category == category]
+        else:
+            return items
+
+    # write access
+    def add_item(self, text: str, category: str) -> Optional[int]:
+        return self._forward("add_item", text=text, category=category)
+
+    def move_item(self, key: int, category: str) -> None:
+        return self._forward("move_item", key=key, category=category)
+
+    def remove(self, key: int) -> None:
+        return self._forward("remove", key=key)
+
+    def toggle(self, key: int) -> None:
+        return self._forward("toggle", key=key)
+
+
+class Relay(Backend):
+    """
+    Backend, which serves a replica of another backend.
+
+    Downstream clients connect with the relays own connection string,
+    reads are answered locally and writes are forwarded upstream.
+    """
+
+    port = 8082
+
+    def __init__(
+        self,
+        upstream_connection_string: str,
+        auth_token: Optional[str],
+        sync_interval: float = 2.0,
+        upstream_timeout: Optional[float] = 10.0,
+        **kwargs,
+    ):
+        """
+        :param upstream_connection_string: Connection string of the backend to relay,
+            the relay connection string of the backend raises the rate limit of the relay
+        :param sync_interval: Seconds between syncs of the replica with the upstream backend
+        :param upstream_timeout: Seconds to wait for the upstream backend, before the connection is dropped
+        """
+        super().__init__(auth_token, **kwargs)
+        self.upstream_connection_string = upstream_connection_string
+        self.sync_interval = sync_interval
+        self.upstream_timeout = upstream_timeout
+
+    def create_store(self) -> RetroStore:
+        store = ReplicaStore(self.connect_upstream, interval=self.sync_interval)
+        store.start()
+        return store
+
+    def connect_upstream(self) -> RPCClient:
+        upstream = RPCClient()
+        upstream.connect(self.upstream_connection_string, timeout=self.upstream_timeout)
+        if upstream.relay_secret is None:
+            logger.warning(
+                f"No relay connection string, all clients share the rate limit of one client"
+            )
+            return upstream
+
+        # raises the rate limit of the upstream connection, which is shared by all our clients
+        try:
+            response = upstream.call(
+                RPCConnectionHandler.REGISTER_RELAY, secret=upstream.relay_secret
+            )
+        except OSError:
+            upstream.net.close()
+            raise
+        if "error" in response:
+            upstream.net.close()
+            error = response["error"]
+            raise RPCError(error.get("code"), error.get("message"))
+        return upstream
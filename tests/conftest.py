@@ -0,0 +1,142 @@
+import socket
+from time import monotonic, sleep
+from typing import Iterable, List, Optional
+
+import pytest
+
+from retro.backend import Backend
+from retro.net.client import Client
+from retro.persistence import InMemoryStore, Item
+from retro.relay import Relay
+
+
+class FaultyStore(InMemoryStore):
+    """InMemoryStore, which delays and then fails the given methods"""
+
+    def __init__(
+        self,
+        methods: Iterable[str],
+        error: Optional[Exception] = OSError("disk full"),
+        delay: float = 0,
+    ):
+        """
+        :param methods: Names of the faulty store methods
+        :param error: Raised by the faulty methods, None to only delay them
+        :param delay: Seconds the faulty methods take
+        """
+        super().__init__()
+        self.methods = set(methods)
+        self.error = error
+        self.delay = delay
+
+    def _fault(self, method: str):
+        if method in self.methods:
+            sleep(self.delay)
+            if self.error:
+                raise self.error
+
+    def list(self, category: Optional[str] = None) -> List[Item]:
+        self._fault("list")
+        return super().list(category)
+
+    def add_item(self, text: str, category: str) -> int:
+        self._fault("add_item")
+        return super().add_item(text, category)
+
+    def move_item(self, key: int, category: str) -> None:
+        self._fault("move_item")
+        super().move_item(key, category)
+
+    def remove(self, key: int) -> None:
+        self._fault("remove")
+        super().remove(key)
+
+    def toggle(self, key: int) -> None:
+        self._fault("toggle")
+        super().toggle(key)
+
+
+class LocalBackend(Backend):
+    """Backend on loopback, which keeps the retro in memory"""
+
+    def __init__(self, store=None, **kwargs):
+        super().__init__(None, port=0, use_tunnel=False, **kwargs)
+        self.store = store or InMemoryStore()
+
+    def create_store(self):
+        return self.store
+
+
+@pytest.fixture
+def faulty_store():
+    return FaultyStore
+
+
+@pytest.fixture
+def start_backend():
+    def start(**kwargs) -> Backend:
+        backend = LocalBackend(**kwargs)
+        backend.start()
+        assert backend.ready.wait(5)
+        return backend
+
+    return start
+
+
+@pytest.fixture
+def backend(start_backend):
+    return start_backend()
+
+
+@pytest.fixture
+def start_relay():
+    def start(backend: Backend, connection_string=None, **kwargs) -> Relay:
+        relay = Relay(
+            connection_string or backend.relay_connection_string(),
+            None,
+            port=0,
+            use_tunnel=False,
+            **kwargs,
+        )
+        relay.start()
+        assert relay.ready.wait(5)
+        return relay
+
+    return start
+
+
+@pytest.fixture
+def connect():
+    """Raw network connection to a backend"""
+
+    def connect_(backend: Backend):
+        client = Client()
+        client.connect(backend.connection_string())
+        return client.net
+
+    return connect_
+
+
+@pytest.fixture
+def drop_connections():
+    """Closes all connections of the backend from the server side"""
+
+    def drop(backend: Backend):
+        for handler in backend._handlers:
+            # close alone does not wake up the handler blocked in recv
+            handler.network.socket.shutdown(socket.SHUT_RDWR)
+
+    return drop
+
+
+@pytest.fixture
+def wait_for():
+    """Waits until the condition is met, for state which is synced in the background"""
+
+    def wait_for_(condition, timeout: float = 5):
+        deadline = monotonic() + timeout
+        while not condition():
+            assert monotonic() < deadline, "condition not met in time"
+            sleep(0.01)
+
+    return wait_for_
@@ -0,0 +1,129 @@
+from contextlib import suppress
+from time import sleep
+
+import pytest
+
+from retro.backend import RateLimiter, RPCStore
+from retro.persistence import Category
+
+
+def test_rate_limiter_allows_burst_then_blocks():
+    limiter = RateLimiter(rate=0.1, burst=3)
+
+    assert [limiter.allow() for _ in range(4)] == [True, True, True, False]
+
+
+def test_rate_limiter_below_one_request_per_second_refills():
+    limiter = RateLimiter(rate=0.5)
+
+    assert limiter.allow()
+    assert not limiter.allow()
+
+    limiter._last -= 2
+    assert limiter.allow()
+
+
+def test_rpc_store_calls_store():
+    store = RPCStore()
+
+    assert store.rpc(
+        {"method": "add_item", "params": {"text": "a", "category": Category.GOOD}}
+    ) == {"result": 0}
+    assert store.rpc({"method": "list"})["result"][0].text == "a"
+
+
+@pytest.mark.parametrize("method", ["__init__", "_save", "missing", None, ["list"]])
+def test_rpc_store_only_exposes_store_interface(method):
+    assert RPCStore().rpc({"method": method})["error"]["code"] == -32601
+
+
+@pytest.mark.parametrize("params", [{"unknown": 1}, {"text": "a"}, ["a", "b"]])
+def test_rpc_store_invalid_params(params):
+    response = RPCStore().rpc({"method": "add_item", "params": params})
+
+    assert response["error"]["code"] == -32602
+
+
+def test_rpc_store_invalid_request():
+    assert RPCStore().rpc(["list"])["error"]["code"] == -32600
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        (
+            {"method": "add_item", "params": {"text": "a", "category": Category.GOOD}},
+            OSError("disk full"),
+        ),
+        ({"method": "toggle", "params": {"key": 0}}, TypeError("bug in store")),
+    ],
+)
+def test_rpc_store_reports_store_errors(faulty_store, data, error):
+    response = RPCStore(faulty_store([data["method"]], error=error)).rpc(data)
+
+    assert response["error"] == {"code": -32603, "message": "Internal error"}
+
+
+def test_backend_rate_limits_requests(start_backend, connect):
+    net = connect(start_backend(max_requests_per_second=3))
+
+    responses = []
+    for _ in range(5):
+        net.send_json({"method": "list"})
+        responses.append(net.recv_json())
+
+    assert responses[:3] == [{"result": []}] * 3
+    assert responses[3]["error"]["code"] == -32000
+
+
+def test_backend_without_rate_limit(start_backend, connect):
+    net = connect(start_backend(max_requests_per_second=None))
+
+    for _ in range(50):
+        net.send_json({"method": "list"})
+        assert net.recv_json() == {"result": []}
+
+
+def test_backend_keeps_connection_after_store_error(
+    start_backend, connect, faulty_store
+):
+    net = connect(start_backend(store=faulty_store(["add_item"])))
+
+    net.send_json({"method": "add_item", "params": {"text": "a", "category": "GOOD"}})
+    assert net.recv_json()["error"]["code"] == -32603
+
+    net.send_json({"method": "list"})
+    assert net.recv_json() == {"result": []}
+
+
+def test_backend_closes_connection_on_large_frame(start_backend, connect):
+    net = connect(start_backend(max_frame_size=200))
+
+    net.send_json({"method": "list", "params": {"category": "x" * 300}})
+
+    # depending on timing the connection is closed or reset
+    with suppress(ConnectionResetError):
+        assert net.recv_json() is None
+
+
+def test_backend_closes_idle_connection(start_backend, connect):
+    net = connect(start_backend(idle_timeout=0.2))
+    sleep(0.5)
+
+    net.socket.settimeout(1)
+    assert net.recv_json() is None
+
+
+def test_backend_limits_connections(start_backend, connect):
+    backend = start_backend(max_connections=2)
+    first, second = connect(backend), connect(backend)
+
+    third = connect(backend)
+    third.socket.settimeout(1)
+    assert third.recv_json() is None
+
+    first.close()
+    sleep(0.2)
+    fourth = connect(backend)
+    fourth.send_json({"method": "list"})
+    assert fourth.recv_json() == {"result": []}
@@ -0,0 +1,200 @@
+from time import sleep
+
+import pytest
+
+from retro.net.client import RPCStoreClient
+from retro.persistence import Category
+
+
+@pytest.fixture
+def rejects():
+    return []
+
+
+@pytest.fixture
+def start_client(rejects):
+    def start(server, **kwargs) -> RPCStoreClient:
+        client = RPCStoreClient(
+            on_reject=lambda method, params, message: rejects.append(
+                (method, params, message)
+            ),
+            **kwargs,
+        )
+        client.connect(server.connection_string())
+        return client
+
+    return start
+
+
+def texts(items):
+    return sorted(item.text for item in items)
+
+
+def test_writes_are_applied_locally(backend, start_client):
+    client = start_client(backend)
+
+    client.add_item("a", Category.GOOD)
+    client.toggle(-1)
+
+    assert [(item.key, item.text, item.done) for item in client.list()] == [
+        (-1, "a", True)
+    ]
+
+
+def test_writes_reach_server_and_reconcile(backend, start_client, wait_for, rejects):
+    client = start_client(backend)
+
+    client.add_item("a", Category.GOOD)
+    client.add_item("b", Category.BAD)
+
+    wait_for(lambda: [item.key for item in client.list()] == [0, 1])
+    assert texts(backend.store.list()) == ["a", "b"]
+    assert client.list(Category.BAD)[0].text == "b"
+    assert rejects == []
+
+
+def test_sync_shows_changes_of_others(backend, start_client, wait_for):
+    changes = []
+    client = start_client(
+        backend, poll_interval=0.1, on_change=lambda: changes.append(True)
+    )
+
+    backend.store.add_item("other", Category.GOOD)
+
+    wait_for(lambda: texts(client.list()) == ["other"])
+    assert changes
+
+
+def test_rate_limited_writes_are_sent_again(
+    start_backend, start_client, wait_for, rejects
+):
+    backend = start_backend(max_requests_per_second=20)
+    client = start_client(backend)
+
+    for i in range(60):
+        client.add_item(str(i), Category.GOOD)
+
+    wait_for(lambda: len(backend.store.list()) == 60, timeout=10)
+    wait_for(lambda: all(item.key >= 0 for item in client.list()))
+    assert len(client.list()) == 60
+    assert rejects == []
+
+
+def test_writes_through_relay(backend, start_relay, start_client, wait_for, rejects):
+    relay = start_relay(backend)
+    clients = [start_client(relay) for _ in range(4)]
+
+    for i in range(12):
+        for n, client in enumerate(clients):
+            client.add_item(f"{n}-{i}", Category.GOOD)
+        sleep(0.1)
+
+    wait_for(lambda: len(backend.store.list()) == 48, timeout=10)
+    assert rejects == []
+
+
+def test_sync_while_writes_are_queued(
+    start_backend, start_client, wait_for, faulty_store
+):
+    slow_store = faulty_store(["toggle"], error=None, delay=0.05)
+    backend = start_backend(store=slow_store, max_requests_per_second=None)
+    backend.store.add_item("a", Category.GOOD)
+    client = start_client(backend, poll_interval=0.1)
+
+    for _ in range(60):
+        client.toggle(0)
+    backend.store.add_item("other", Category.GOOD)
+
+    # the queue needs three seconds to drain
+    wait_for(lambda: "other" in texts(client.list()), timeout=1)
+    assert client._pending
+
+
+def test_writes_to_added_item_use_assigned_key(
+    backend, start_client, wait_for, rejects
+):
+    client = start_client(backend)
+
+    client.add_item("a", Category.GOOD)
+    client.toggle(-1)
+    client.move_item(-1, Category.BAD)
+
+    wait_for(lambda: [item.key for item in client.list()] == [0])
+    # key shown before the server assigned one
+    client.toggle(-1)
+
+    wait_for(lambda: not client._pending)
+    assert [(item.category, item.done) for item in backend.store.list()] == [
+        (Category.BAD, False)
+    ]
+    assert rejects == []
+
+
+def test_rejected_writes_roll_back(
+    start_backend, start_client, wait_for, rejects, faulty_store
+):
+    backend = start_backend(store=faulty_store(["add_item"]))
+    client = start_client(backend)
+
+    client.add_item("a", Category.GOOD)
+    client.toggle(-1)
+
+    wait_for(lambda: len(rejects) == 2)
+    assert [(method, message) for method, params, message in rejects] == [
+        ("add_item", "Internal error"),
+        ("toggle", "Item was not added"),
+    ]
+    assert client.list() == []
+
+
+def test_unexpected_errors_are_retried_with_backoff(
+    backend, start_client, wait_for, monkeypatch
+):
+    client = start_client(backend, poll_interval=0.4)
+    calls = []
+
+    def broken_call(method, **params):
+        calls.append(method)
+        raise ValueError("bug")
+
+    monkeypatch.setattr(client, "call", broken_call)
+    client.add_item("a", Category.GOOD)
+    sleep(1)
+
+    # delays of 0.1, 0.2, 0.4 and 0.4 seconds
+    assert 3 <= len(calls) <= 6
+
+    monkeypatch.undo()
+    wait_for(lambda: texts(backend.store.list()) == ["a"])
+
+
+def test_writes_to_unknown_item_are_rejected(backend, start_client, rejects):
+    client = start_client(backend)
+
+    client.remove(42)
+
+    assert rejects == [("remove", {"key": 42}, "Item 42 not found")]
+
+
+def test_lost_connection_is_reported(
+    backend, start_client, wait_for, rejects, drop_connections
+):
+    disconnects = []
+    client = start_client(
+        backend, poll_interval=0.1, on_disconnect=disconnects.append
+    )
+    client.add_item("a", Category.GOOD)
+    wait_for(lambda: [item.key for item in client.list()] == [0])
+
+    drop_connections(backend)
+    wait_for(lambda: disconnects)
+
+    client.toggle(0)
+    assert rejects == [("toggle", {"key": 0}, "Lost connection")]
+    assert [item.done for item in client.list()] == [False]
+    with pytest.raises(OSError):
+        client.ping()
+
+
+def test_ping(backend, start_client):
+    assert start_client(backend).ping() < 1
@@ -0,0 +1,192 @@
+from time import sleep, monotonic
+
+import pytest
+
+from retro.net.client import RPCStoreClient
+from retro.persistence import Category
+
+
+def add_item(net, text: str, category: str = Category.GOOD):
+    net.send_json(
+        {"method": "add_item", "params": {"text": text, "category": category}}
+    )
+    return net.recv_json()
+
+
+def list_items(net):
+    net.send_json({"method": "list"})
+    return net.recv_json()["result"]
+
+
+def test_relay_forwards_writes(backend, start_relay, connect):
+    relay = start_relay(backend)
+    net = connect(relay)
+
+    assert "error" not in add_item(net, "via relay")
+
+    assert [item.text for item in backend.store.list()] == ["via relay"]
+    assert [item["text"] for item in list_items(net)] == ["via relay"]
+
+
+def test_relay_answers_reads_from_replica(backend, start_relay, connect, wait_for):
+    relay = start_relay(backend, sync_interval=0.1)
+    net = connect(relay)
+
+    backend.store.add_item("direct", Category.BAD)
+    assert list_items(net) == []
+
+    wait_for(lambda: [item["text"] for item in list_items(net)] == ["direct"])
+
+
+def test_relay_applies_acknowledged_writes_to_replica(backend, start_relay, connect):
+    net = connect(start_relay(backend))
+
+    add_item(net, "a")
+    add_item(net, "b")
+    net.send_json({"method": "toggle", "params": {"key": 0}})
+    net.recv_json()
+    net.send_json({"method": "remove", "params": {"key": 1}})
+    net.recv_json()
+
+    # the replica is up to date without waiting for the next sync
+    assert list_items(net) == [
+        {"key": 0, "text": "a", "category": Category.GOOD, "done": True}
+    ]
+
+
+def test_relay_reads_do_not_wait_for_forwarded_writes(
+    start_backend, start_relay, connect, faulty_store
+):
+    backend = start_backend(store=faulty_store(["toggle"], error=None, delay=1))
+    backend.store.add_item("slow", Category.GOOD)
+    relay = start_relay(backend)
+    writer, reader = connect(relay), connect(relay)
+
+    writer.send_json({"method": "toggle", "params": {"key": 0}})
+    sleep(0.1)
+
+    start = monotonic()
+    assert [item["done"] for item in list_items(reader)] == [False]
+    assert monotonic() - start < 0.5
+
+    assert "error" not in writer.recv_json()
+    assert [item["done"] for item in list_items(reader)] == [True]
+
+
+def test_relay_passes_on_upstream_errors(
+    start_backend, start_relay, connect, faulty_store
+):
+    backend = start_backend(store=faulty_store(["toggle"]))
+    backend.store.add_item("a", Category.GOOD)
+    net = connect(start_relay(backend))
+
+    net.send_json({"method": "toggle", "params": {"key": 0}})
+
+    assert net.recv_json()["error"] == {"code": -32603, "message": "Internal error"}
+
+
+def test_relay_passes_on_upstream_rate_limit(start_backend, start_relay, connect):
+    backend = start_backend(max_relay_requests_per_second=4)
+    net = connect(start_relay(backend))
+
+    # the relay registers and syncs the replica, which leaves two requests
+    responses = [add_item(net, str(i)) for i in range(5)]
+
+    assert "error" not in responses[0]
+    assert responses[-1]["error"]["code"] == -32000
+
+
+def test_relay_connection_has_higher_rate_limit(start_backend, start_relay, connect):
+    backend = start_backend(max_requests_per_second=2)
+    relay = start_relay(backend)
+    nets = [connect(relay) for _ in range(4)]
+
+    for i in range(5):
+        for n, net in enumerate(nets):
+            assert "error" not in add_item(net, f"{n}-{i}")
+
+    assert len(backend.store.list()) == 20
+
+
+def test_relay_with_ordinary_connection_string_has_client_rate_limit(
+    start_backend, start_relay, connect
+):
+    backend = start_backend(max_requests_per_second=4)
+    net = connect(start_relay(backend, backend.connection_string()))
+
+    responses = [add_item(net, str(i)) for i in range(5)]
+
+    assert responses[-1]["error"]["code"] == -32000
+
+
+@pytest.mark.parametrize("params", [{}, {"secret": "guessed"}, {"secret": 1}])
+def test_relay_registration_requires_relay_secret(start_backend, connect, params):
+    net = connect(start_backend(max_requests_per_second=3))
+
+    net.send_json({"method": "register_relay", "params": params})
+    assert net.recv_json()["error"] == {
+        "code": -32602,
+        "message": "Invalid relay secret",
+    }
+
+    # the registration counts as request, the connection keeps the client limit
+    assert [list_items(net) for _ in range(2)] == [[], []]
+    net.send_json({"method": "list"})
+    assert net.recv_json()["error"]["code"] == -32000
+
+
+def test_relay_reports_lost_upstream(backend, start_relay, connect, drop_connections):
+    relay = start_relay(backend)
+    net = connect(relay)
+
+    drop_connections(backend)
+    sleep(0.1)
+
+    assert add_item(net, "lost")["error"]["code"] == -32603
+    # the replica is not synced anymore
+    net.send_json({"method": "list"})
+    assert net.recv_json()["error"] == {
+        "code": -32603,
+        "message": "Lost connection to upstream",
+    }
+
+
+def test_relay_reconnects_to_upstream(
+    start_backend, start_relay, connect, drop_connections, wait_for
+):
+    backend = start_backend(max_requests_per_second=1)
+    net = connect(start_relay(backend, sync_interval=0.1))
+
+    drop_connections(backend)
+    wait_for(lambda: "error" not in add_item(net, "again"))
+
+    # the relay registered again, so it is not limited like a single client
+    for i in range(5):
+        assert "error" not in add_item(net, str(i))
+    assert len(backend.store.list()) == 6
+
+
+def test_relay_drops_upstream_which_does_not_answer(
+    start_backend, start_relay, connect, faulty_store
+):
+    backend = start_backend(store=faulty_store(["toggle"], error=None, delay=1))
+    backend.store.add_item("slow", Category.GOOD)
+    net = connect(start_relay(backend, upstream_timeout=0.2))
+
+    start = monotonic()
+    net.send_json({"method": "toggle", "params": {"key": 0}})
+
+    assert net.recv_json()["error"]["code"] == -32603
+    assert monotonic() - start < 0.5
+
+
+def test_backend_relay_client(backend, start_relay, wait_for):
+    relay = start_relay(backend, sync_interval=0.1)
+    client = RPCStoreClient(poll_interval=0.1)
+    client.connect(relay.connection_string())
+
+    client.add_item("via relay", Category.GOOD)
+    wait_for(lambda: [item.text for item in backend.store.list()] == ["via relay"])
+
+    backend.store.toggle(0)
+    wait_for(lambda: [item.done for item in client.list()] == [True])